@@ -7,12 +7,13 @@ from PIL import Image
 
 # --- BACKEND IMPORT ---
 from backend import (
-    DB_FILE, LIB_FILE, RECIPE_FILE, HISTORY_FILE, NUTRIENTS, ALL_NUTRIENTS, UNITS,
-    KATEGORIEN, MHD_DEFAULTS,
-    init_dbs, load_data, save_data, log_history, to_grams, from_grams,
+    DB_FILE, LIB_FILE, RECIPE_FILE, HISTORY_FILE, INTAKE_FILE, NUTRIENTS, ALL_NUTRIENTS, UNITS,
+    KATEGORIEN, MHD_DEFAULTS, PICKER_TOP_N,
+    init_dbs, load_data, save_data, log_history, log_consumption, nutrient_vector, to_grams, from_grams,
     predict_category, fetch_comprehensive_data, search_usda_list, get_usda_data_by_id,
     add_to_inventory, update_inventory_item, delete_inventory_item,
-    calculate_recipe_totals, deduct_cooked_recipe_from_inventory, get_stats_data
+    calculate_recipe_totals, deduct_cooked_recipe_from_inventory, get_stats_data, get_intake_data, rebuild_daily_intake,
+    get_search_index, search_index
 )
 
 try:
@@ -96,24 +97,30 @@ if menu == "📥 Einkauf eintragen":
             st.info("📚 Deine Bibliothek ist noch leer. Bitte nutze zuerst den Wizard für neue Produkte.")
         else:
             st.markdown("<div class='fast-track-box'>", unsafe_allow_html=True)
-            with st.form("fast_track_form"):
-                sel_lib = st.selectbox("Welches Produkt hast du gekauft?", sorted(lib["Name"].tolist()))
-                c1, c2, c3 = st.columns(3)
-                ft_menge = c1.number_input("Menge*", value=None, placeholder="Zahl...", step=0.1)
+            lib_index = get_search_index(lib, LIB_FILE)
+            ft_query = st.text_input("🔍 Produkt suchen...", placeholder="Name oder Marke, Tippfehler sind okay")
+            ft_hits = search_index(lib_index, ft_query, PICKER_TOP_N)
+            if not ft_hits: st.warning("Kein passendes Produkt in der Bibliothek gefunden.")
+            else:
+                with st.form("fast_track_form"):
+                    sel_pos = st.selectbox("Welches Produkt hast du gekauft?", ft_hits, format_func=lambda p: lib_index["labels"][p])
+                    c1, c2, c3 = st.columns(3)
+                    ft_menge = c1.number_input("Menge*", value=None, placeholder="Zahl...", step=0.1)
                 
-                ref_item = lib[lib["Name"] == sel_lib].iloc[0]
-                ft_einheit = c2.selectbox("Einheit", [ref_item["Einheit_Std"]] + [u for u in UNITS if u != ref_item["Einheit_Std"]])
-                ft_preis = c3.number_input("Gesamtpreis (€)*", value=None, placeholder="0.00", step=0.01)
-                ft_mhd = st.date_input("MHD*", value=datetime.now() + timedelta(days=MHD_DEFAULTS.get(ref_item["Kategorie"], 14)))
+                    ref_item = lib.iloc[sel_pos]
+                    sel_lib = ref_item["Name"]
+                    ft_einheit = c2.selectbox("Einheit", [ref_item["Einheit_Std"]] + [u for u in UNITS if u != ref_item["Einheit_Std"]])
+                    ft_preis = c3.number_input("Gesamtpreis (€)*", value=None, placeholder="0.00", step=0.01)
+                    ft_mhd = st.date_input("MHD*", value=datetime.now() + timedelta(days=MHD_DEFAULTS.get(ref_item["Kategorie"], 14)))
                 
-                if st.form_submit_button("💾 Sofort Einlagern"):
-                    if ft_menge and ft_preis is not None:
-                        entry = {"Name": sel_lib, "Marke": ref_item["Marke"], "Menge": ft_menge, "Einheit": ft_einheit, "Preis": ft_preis, "MHD": ft_mhd.strftime("%Y-%m-%d")}
-                        for n in ALL_NUTRIENTS: entry[n] = float(ref_item.get(n, 0.0))
-                        save_data(add_to_inventory(inv, entry), DB_FILE)
-                        log_history("Aufnahme (Fast)", entry["Name"], entry["Marke"], entry["Menge"], entry["Einheit"], entry["Preis"])
-                        st.success(f"{sel_lib} erfolgreich eingelagert!"); st.rerun()
-                    else: st.error("Bitte Menge und Preis angeben.")
+                    if st.form_submit_button("💾 Sofort Einlagern"):
+                        if ft_menge and ft_preis is not None:
+                            entry = {"Name": sel_lib, "Marke": ref_item["Marke"], "Menge": ft_menge, "Einheit": ft_einheit, "Preis": ft_preis, "MHD": ft_mhd.strftime("%Y-%m-%d")}
+                            for n in ALL_NUTRIENTS: entry[n] = float(ref_item.get(n, 0.0))
+                            save_data(add_to_inventory(inv, entry), DB_FILE)
+                            log_history("Aufnahme (Fast)", entry["Name"], entry["Marke"], entry["Menge"], entry["Einheit"], entry["Preis"])
+                            st.success(f"{sel_lib} erfolgreich eingelagert!"); st.rerun()
+                        else: st.error("Bitte Menge und Preis angeben.")
             st.markdown("</div>", unsafe_allow_html=True)
 
     # --- WIZARD ---
@@ -280,8 +287,11 @@ elif menu == "🍳 Rezept Labor":
     else:
         if st.session_state.recipe_phase == "build":
             st.markdown("<div class='card'>", unsafe_allow_html=True)
+            lib_index = get_search_index(lib, LIB_FILE)
+            r_query = st.text_input("🔍 Zutat suchen...", placeholder="z.B. Linsen, Kokosmilch")
             c_sel, c_qty, c_add = st.columns([3, 1, 1])
-            sel_item = c_sel.selectbox("Zutat aus Bibliothek", ["--"] + sorted(lib["Name"].tolist()))
+            sel_pos = c_sel.selectbox("Zutat aus Bibliothek", [None] + search_index(lib_index, r_query, PICKER_TOP_N), format_func=lambda p: "--" if p is None else lib_index["labels"][p])
+            sel_item = "--" if sel_pos is None else lib.iloc[sel_pos]["Name"]
             qty_item = c_qty.number_input("Menge", value=None, placeholder="z.B. 150")
             
             if c_add.button("➕ Hinzufügen"):
@@ -291,7 +301,7 @@ elif menu == "🍳 Rezept Labor":
                         st.session_state.recipe_items[existing_idx]["RezeptMenge"] += float(qty_item)
                         st.toast(f"Menge aktualisiert!")
                     else:
-                        details = lib[lib["Name"] == sel_item].iloc[0].to_dict()
+                        details = lib.iloc[sel_pos].to_dict()
                         details["RezeptMenge"] = float(qty_item)
                         st.session_state.recipe_items.append(details)
                         st.toast(f"{sel_item} hinzugefügt!")
@@ -364,8 +374,9 @@ elif menu == "🍳 Rezept Labor":
                             s_item["RezeptMenge"] = s_item["RezeptMenge"] * scaler
                             scaled_recipe_items.append(s_item)
                         
-                        # Absicherung: Die skalierte Liste vom Vorrat abziehen
-                        save_data(deduct_cooked_recipe_from_inventory(scaled_recipe_items, inv), DB_FILE)
+                        # Absicherung: Die skalierte Liste vom Vorrat abziehen (verkocht, nicht gegessen -> keine Aufnahme)
+                        save_data(deduct_cooked_recipe_from_inventory(scaled_recipe_items, inv, track_intake=False), DB_FILE)
+                        if eat_g > 0: log_consumption(r_name, "Selbstgekocht", -eat_g, "g", nutrient_vector(nutris, eat_g))
                         saved_g = w_scaled - eat_g
                         
                         # Absicherung Zero Division bei 0g Gesamtgewicht
@@ -406,7 +417,7 @@ elif menu == "📦 Vorrat & Inventur":
         search_term = st.text_input("🔍 Vorrat durchsuchen...", placeholder="z.B. Tomaten, Milch, ...")
         filtered_inv = inv_data.copy()
         if search_term:
-            filtered_inv = filtered_inv[filtered_inv["Name"].str.contains(search_term, case=False, na=False)]
+            filtered_inv = filtered_inv.iloc[search_index(get_search_index(inv_data, DB_FILE), search_term, len(inv_data))]
 
         tab_view, tab_edit = st.tabs(["👁️ Übersicht", "✏️ Bestand korrigieren"])
         
@@ -436,22 +447,65 @@ elif menu == "📦 Vorrat & Inventur":
 # ==========================================
 elif menu == "📊 Statistik":
     st.title("📊 Finanz & Konsum Dashboard")
-    h_data = load_data(HISTORY_FILE).copy()
-    s_data = get_stats_data(h_data)
+    tab_money, tab_intake = st.tabs(["💶 Ausgaben", "🥦 Nährstoffaufnahme"])
     
-    if s_data.empty:
-        st.info("📈 Noch keine Ausgaben erfasst. Trage deinen ersten Einkauf ein!")
-    else:
-        c_year, c_month = st.columns(2)
-        year = c_year.selectbox("Jahr", sorted(s_data["Datum"].dt.year.unique(), reverse=True))
-        month = c_month.selectbox("Monat (Optional)", ["Alle"] + list(range(1, 13)))
+    with tab_money:
+        h_data = load_data(HISTORY_FILE).copy()
+        s_data = get_stats_data(h_data)
+    
+        if s_data.empty:
+            st.info("📈 Noch keine Ausgaben erfasst. Trage deinen ersten Einkauf ein!")
+        else:
+            c_year, c_month = st.columns(2)
+            year = c_year.selectbox("Jahr", sorted(s_data["Datum"].dt.year.unique(), reverse=True))
+            month = c_month.selectbox("Monat (Optional)", ["Alle"] + list(range(1, 13)))
+        
+            filtered = s_data[s_data["Datum"].dt.year == year]
+            if month != "Alle": filtered = filtered[filtered["Datum"].dt.month == month]
+        
+            st.metric("Gesamtausgaben im Zeitraum", f"{filtered['Preis'].sum():.2f} €")
+            fig = px.bar(filtered, x="Datum", y="Preis", color="Aktion", title="Ausgabenverlauf", template="plotly_dark", color_discrete_sequence=px.colors.sequential.Greens_r)
+            st.plotly_chart(fig, use_container_width=True)
+    
+    with tab_intake:
+        # Liest nur die materialisierte Tagesbilanz – unabhängig von der Länge der Historie
+        i_data = get_intake_data(load_data(INTAKE_FILE).copy())
         
-        filtered = s_data[s_data["Datum"].dt.year == year]
-        if month != "Alle": filtered = filtered[filtered["Datum"].dt.month == month]
+        if i_data.empty:
+            st.info("🥦 Noch keine Nährstoffaufnahme erfasst. Verbrauche etwas aus dem Vorrat oder koche ein Rezept!")
+        else:
+            c_year, c_month = st.columns(2)
+            i_year = c_year.selectbox("Jahr", sorted(i_data["Datum"].dt.year.unique(), reverse=True), key="i_year")
+            i_month = c_month.selectbox("Monat (Optional)", ["Alle"] + list(range(1, 13)), key="i_month")
+            
+            i_filtered = i_data[i_data["Datum"].dt.year == i_year]
+            if i_month != "Alle": i_filtered = i_filtered[i_filtered["Datum"].dt.month == i_month]
+            
+            if i_filtered.empty:
+                st.warning("Für diesen Zeitraum liegen keine Verbrauchsdaten vor.")
+            else:
+                totals = i_filtered[ALL_NUTRIENTS].sum()
+                # Kalendertage des Zeitraums (höchstens bis heute), nicht nur Tage mit Einträgen
+                p_start = pd.Timestamp(int(i_year), 1 if i_month == "Alle" else int(i_month), 1)
+                p_end = p_start + (pd.offsets.YearEnd(0) if i_month == "Alle" else pd.offsets.MonthEnd(0))
+                days = max((min(p_end, pd.Timestamp(datetime.now().date())) - p_start).days + 1, 1)
+                m1, m2, m3 = st.columns(3)
+                m1.metric("Energie gesamt", f"{totals['kcal_100']:.0f} kcal")
+                m2.metric("Eiweiß gesamt", f"{totals['Prot_100']:.1f} g")
+                m3.metric("Ø Energie pro Tag", f"{totals['kcal_100'] / days:.0f} kcal")
+                
+                sel_n = st.selectbox("Nährstoff im Verlauf", ALL_NUTRIENTS, format_func=lambda n: n.replace("_100", ""))
+                fig = px.bar(i_filtered, x="Datum", y=sel_n, title=f"Tägliche Aufnahme: {sel_n.replace('_100', '')}", template="plotly_dark", color_discrete_sequence=["#2e7d32"])
+                st.plotly_chart(fig, use_container_width=True)
+                
+                summary = pd.DataFrame({"Gesamt": totals, "Ø pro Tag": totals / days}).round(2)
+                st.dataframe(summary.rename(index=lambda n: n.replace("_100", "")), use_container_width=True)
         
-        st.metric("Gesamtausgaben im Zeitraum", f"{filtered['Preis'].sum():.2f} €")
-        fig = px.bar(filtered, x="Datum", y="Preis", color="Aktion", title="Ausgabenverlauf", template="plotly_dark", color_discrete_sequence=px.colors.sequential.Greens_r)
-        st.plotly_chart(fig, use_container_width=True)
+        with st.expander("🔄 Tagesbilanz reparieren"):
+            st.caption("Berechnet die Tagesbilanz komplett aus der Historie neu und trägt ältere Verbrauchs-Einträge ohne Nährwerte über die Bibliothek nach.")
+            if st.button("Tagesbilanz neu aufbauen"):
+                n_days, n_backfilled = rebuild_daily_intake(load_data(LIB_FILE).copy())
+                st.success(f"{n_days} Tage neu berechnet, {n_backfilled} alte Einträge nachgetragen."); st.rerun()
 
 # ==========================================
 # MODUL 5: BIBLIOTHEK
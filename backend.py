@@ -4,6 +4,15 @@ import json
 import gspread
 import streamlit as st
 import difflib
+import re
+import csv
+import math
+import time
+import bisect
+import heapq
+from collections import Counter
+from itertools import zip_longest
+from gspread.utils import rowcol_to_a1
 from google.oauth2.service_account import Credentials
 from datetime import datetime, timedelta
 from deep_translator import GoogleTranslator
@@ -11,7 +20,7 @@ from deep_translator import GoogleTranslator
 # ==========================================
 # KONSTANTEN & DATENSTRUKTUR
 # ==========================================
-DB_FILE, LIB_FILE, RECIPE_FILE, HISTORY_FILE = "Vorrat", "Bibliothek", "Rezepte", "Historie"
+DB_FILE, LIB_FILE, RECIPE_FILE, HISTORY_FILE, INTAKE_FILE = "Vorrat", "Bibliothek", "Rezepte", "Historie", "Tagesbilanz"
 
 NUTRIENTS = {
     "Makronährstoffe": ["kcal_100", "Fett_100", "Fett_Sat_100", "Carb_100", "Zucker_100", "Prot_100"],
@@ -20,9 +29,17 @@ NUTRIENTS = {
 }
 ALL_NUTRIENTS = [item for sub in NUTRIENTS.values() for item in sub]
 UNITS = ["g", "kg", "ml", "L", "Stk."]
+PICKER_TOP_N = 25
 
 STD_WEIGHTS = {"zitrone": 60, "ei": 55, "apfel": 150, "banane": 120, "zwiebel": 80, "knoblauch": 5, "kartoffel": 100, "orange": 200, "tomate": 80}
 KATEGORIEN = ["Gemüse", "Obst", "Milchprodukte", "Fleisch", "Fisch", "Getreide", "Konserve", "Snacks", "Getränke", "Gewürze/Saucen", "Selbstgekocht", "Allgemein"]
+SCHEMAS = {
+    LIB_FILE: ["Name", "Marke", "Kategorie", "Menge_Std", "Einheit_Std", "Preis"] + ALL_NUTRIENTS,
+    DB_FILE: ["Name", "Marke", "Menge", "Einheit", "Preis", "MHD"] + ALL_NUTRIENTS,
+    RECIPE_FILE: ["ID", "Name", "Kategorie", "Preis_Gesamt", "Gewicht_Gesamt", "Zutaten_JSON"] + ALL_NUTRIENTS,
+    HISTORY_FILE: ["Datum", "Aktion", "Name", "Marke", "Menge", "Einheit", "Preis", "Naehrwerte_JSON"],
+    INTAKE_FILE: ["Datum"] + ALL_NUTRIENTS
+}
 MHD_DEFAULTS = {"Selbstgekocht": 4, "Fleisch": 3, "Fisch": 2, "Gemüse": 7, "Obst": 7, "Milchprodukte": 10, "Getreide": 180, "Konserve": 365, "Snacks": 180, "Getränke": 180, "Gewürze/Saucen": 365, "Allgemein": 14}
 
 # ==========================================
@@ -36,20 +53,22 @@ def get_gspread_client():
 def get_sheet(): 
     return get_gspread_client().open("NutriStock_DB")
 
+def init_tab(sheet, name, cols):
+    try:
+        ws = sheet.worksheet(name)
+        header = ws.row_values(1)
+        missing = [c for c in cols if c not in header]
+        if not header: ws.insert_row(cols, index=1)
+        elif missing: # Neue Spalten (z.B. Naehrwerte_JSON) an bestehende Tabellen anhängen
+            if len(header) + len(missing) > ws.col_count: ws.add_cols(len(header) + len(missing) - ws.col_count)
+            ws.update(values=[header + missing], range_name="A1")
+    except Exception: # Generischer Catch für fehlende Arbeitsblätter
+        sheet.add_worksheet(title=name, rows="1000", cols="50").insert_row(cols, index=1)
+
 def init_dbs():
     if "dbs_initialized" in st.session_state: return
     sheet = get_sheet()
-    def init_tab(name, cols):
-        try:
-            ws = sheet.worksheet(name)
-            if not ws.row_values(1): ws.insert_row(cols, index=1)
-        except Exception: # Generischer Catch für fehlende Arbeitsblätter
-            sheet.add_worksheet(title=name, rows="1000", cols="50").insert_row(cols, index=1)
-    
-    init_tab(LIB_FILE, ["Name", "Marke", "Kategorie", "Menge_Std", "Einheit_Std", "Preis"] + ALL_NUTRIENTS)
-    init_tab(DB_FILE, ["Name", "Marke", "Menge", "Einheit", "Preis", "MHD"] + ALL_NUTRIENTS)
-    init_tab(RECIPE_FILE, ["ID", "Name", "Kategorie", "Preis_Gesamt", "Gewicht_Gesamt", "Zutaten_JSON"] + ALL_NUTRIENTS)
-    init_tab(HISTORY_FILE, ["Datum", "Aktion", "Name", "Marke", "Menge", "Einheit", "Preis"])
+    for name, cols in SCHEMAS.items(): init_tab(sheet, name, cols)
     st.session_state.dbs_initialized = True
 
 @st.cache_data(ttl=30)
@@ -69,10 +88,58 @@ def save_data(df, sheet_name):
     ws.update(values=[df_to_save.columns.values.tolist()] + df_to_save.values.tolist(), range_name="A1")
     st.cache_data.clear()
 
-def log_history(aktion, name, marke, menge, einheit, preis):
-    try: get_sheet().worksheet(HISTORY_FILE).append_row([datetime.now().strftime("%Y-%m-%d %H:%M:%S"), aktion, name, marke, menge, einheit, preis])
+def log_history(aktion, name, marke, menge, einheit, preis, naehrwerte=None):
+    n_json = json.dumps(naehrwerte, separators=(",", ":")) if naehrwerte is not None else ""  # "{}" = erfasst, aber ohne Nährwerte
+    try: get_sheet().worksheet(HISTORY_FILE).append_row([datetime.now().strftime("%Y-%m-%d %H:%M:%S"), aktion, name, marke, menge, einheit, preis, n_json])
     except: pass
 
+def update_daily_intake(datum, naehrwerte):
+    """Addiert einen Nährstoffvektor inkrementell auf die Tageszeile der Tagesbilanz (legt sie bei Bedarf an)."""
+    if not naehrwerte: return
+    try:
+        ws = get_sheet().worksheet(INTAKE_FILE)
+        header = ws.row_values(1)
+        cell = ws.find(datum, in_column=1)
+        if cell:
+            old = dict(zip(header, ws.row_values(cell.row)))
+            ws.update(values=[[datum] + [round(safe_float(old.get(n)) + naehrwerte.get(n, 0.0), 4) for n in header[1:]]], range_name=f"A{cell.row}")
+        else:
+            ws.append_row([datum] + [round(naehrwerte.get(n, 0.0), 4) for n in header[1:]])
+        st.cache_data.clear()
+    except Exception as e:
+        print(f"Tagesbilanz-Fehler {datum}: {e}")
+
+def rebuild_daily_intake(lib_df=None):
+    """Baut die Tagesbilanz komplett aus den Naehrwerte_JSON-Vektoren der Historie neu auf (Reparatur nach fehlgeschlagenen Updates).
+    Mit lib_df werden alte Verbrauchs-Einträge ohne Vektor (Naehrwerte_JSON leer, nicht "{}") über die Bibliothek nachberechnet.
+    "Verkocht"-Einträge (Zutaten beim Kochen) zählen nie – gegessen wird die Portion, die log_consumption bucht."""
+    lib_by_key = {}
+    if lib_df is not None and not lib_df.empty:
+        for rec in lib_df.to_dict("records"): lib_by_key.setdefault((str(rec["Name"]), str(rec["Marke"])), rec)
+    daily, backfilled = {}, 0
+    for rec in get_sheet().worksheet(HISTORY_FILE).get_all_records():
+        if rec.get("Aktion") != "Verbrauch": continue  # überspringt auch "Verkocht"
+        n_json = str(rec.get("Naehrwerte_JSON") or "")
+        try: vec = json.loads(n_json) if n_json else {}
+        except ValueError: vec = {}
+        # Alt-Einträge von Mealprep überspringen: deren Zutaten wurden beim Kochen bereits als Verbrauch gebucht
+        if not n_json and str(rec.get("Marke")) != "Selbstgekocht":
+            ref = lib_by_key.get((str(rec.get("Name")), str(rec.get("Marke"))))
+            if ref is not None:
+                vec = nutrient_vector(ref, to_grams(abs(safe_float(rec.get("Menge"))), rec.get("Einheit"), rec.get("Name")))
+                if vec: backfilled += 1
+        if not vec: continue
+        day = daily.setdefault(str(rec.get("Datum", ""))[:10], {})
+        for n, v in vec.items(): day[n] = day.get(n, 0.0) + safe_float(v)
+    rows = [[d] + [round(vals.get(n, 0.0), 4) for n in ALL_NUTRIENTS] for d, vals in sorted(daily.items())]
+    save_data(pd.DataFrame(rows, columns=SCHEMAS[INTAKE_FILE]), INTAKE_FILE)
+    return len(rows), backfilled
+
+def log_consumption(name, marke, menge, einheit, naehrwerte):
+    """Verbrauch mit Nährstoffvektor protokollieren und direkt in die Tagesbilanz buchen."""
+    log_history("Verbrauch", name, marke, menge, einheit, 0, naehrwerte)
+    update_daily_intake(datetime.now().strftime("%Y-%m-%d"), naehrwerte)
+
 # ==========================================
 # HILFS-LOGIK & MATCHING
 # ==========================================
@@ -103,6 +170,14 @@ def from_grams(m_g, e, name=""):
         return m_g / 1000.0 if e in ["kg", "L"] else m_g
     except: return 0.0
 
+def nutrient_vector(per_100, grams):
+    """Absolute Nährstoffmengen für `grams` aus Werten pro 100g – kompakt, nur Einträge != 0."""
+    vec = {}
+    for n in ALL_NUTRIENTS:
+        v = safe_float(per_100.get(n, 0)) / 100.0 * grams
+        if v: vec[n] = round(v, 4)
+    return vec
+
 def is_ingredient_match(recipe_name, inv_name):
     r_str, i_str = str(recipe_name).lower(), str(inv_name).lower()
     if r_str == i_str: return True
@@ -111,6 +186,148 @@ def is_ingredient_match(recipe_name, inv_name):
     if r_words.issubset(i_words) or i_words.issubset(r_words): return True
     return False
 
+# ==========================================
+# SUCHINDEX (PRÄFIX, TOKEN & TIPPFEHLER)
+# ==========================================
+_UMLAUTE = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss"})
+
+def normalize_text(text):
+    """Kleinschreibung, Umlaute falten, Satzzeichen zu Leerzeichen."""
+    return re.sub(r"[\W_]+", " ", str(text).lower().translate(_UMLAUTE)).strip()
+
+def _trigrams(token, padded=True):
+    t = f" {token} " if padded else token
+    return {t[i:i+3] for i in range(len(t) - 2)}
+
+def build_search_index(df, fields=("Name", "Marke")):
+    """Baut Token-Postings, sortiertes Vokabular (Präfix via bisect) und Trigramme (Infix/Tippfehler) über Name & Marke."""
+    cols = [f for f in fields if f in df.columns]
+    names, labels, postings, pos_tokens = [], [], {}, []
+    for pos, row in enumerate(df[cols].astype(str).itertuples(index=False, name=None)):
+        vals = [v if v not in ("", "0", "0.0", "nan") else "" for v in row]
+        names.append(normalize_text(vals[0]) if vals else "")
+        labels.append(f"{vals[0]} ({vals[1]})" if len(vals) > 1 and vals[1] else (vals[0] if vals else ""))
+        toks = {}
+        for f_i, val in enumerate(vals):
+            weight = 1.0 if f_i == 0 else 0.6  # Treffer im Namen zählen mehr als in der Marke
+            for tok in normalize_text(val).split():
+                hits = postings.setdefault(tok, {})
+                hits[pos] = toks[tok] = max(hits.get(pos, 0.0), weight)
+        pos_tokens.append(tuple(toks.items()))
+    vocab = sorted(postings)
+    grams = {}
+    for t_i, tok in enumerate(vocab):
+        for g in _trigrams(tok): grams.setdefault(g, []).append(t_i)
+    order = sorted(range(len(names)), key=lambda p: (names[p], labels[p]))
+    return {"names": names, "labels": labels, "postings": postings, "pos_tokens": pos_tokens, "vocab": vocab,
+            "grams": grams, "short_ranked": _build_short_ranked(names, pos_tokens), "order": order}
+
+def _build_short_ranked(names, pos_tokens):
+    """Fertig gerankte Trefferlisten für alle 1- und 2-Zeichen-Suchwörter (erster Tastendruck = nur noch Slicing).
+    Gleiche Stufen wie _match_token/_rank: exakt 3, Präfix 2, Infix 1.5 (x Feldgewicht) plus Namensbonus."""
+    n = len(names)
+    tie = sorted(range(n), key=lambda p: (len(names[p]), names[p]))  # Gleichstand: kurze Namen zuerst, dann alphabetisch
+    tie_rank = [0] * n
+    for r, p in enumerate(tie): tie_rank[p] = r
+    tok_grams, keys = {}, {}
+    for pos, toks in enumerate(pos_tokens):
+        best = {}
+        for tok, w in toks:
+            tg = tok_grams.get(tok)
+            if tg is None:
+                tg = tok_grams[tok] = [(g, 3.0 if tok == g else 2.0 if tok.startswith(g) else 1.5) for g in {tok[i:i+k] for k in (1, 2) for i in range(len(tok) - k + 1)}]
+            for g, s in tg:
+                if s * w > best.get(g, 0.0): best[g] = s * w
+        name = names[pos]
+        for g, s in best.items():
+            s += 5.0 if name == g else 2.0 if name.startswith(g) else 0.0
+            # Ein int als Sortierschlüssel (Score absteigend, dann Gleichstand-Rang) ist deutlich schneller als Tupel
+            keys.setdefault(g, []).append((100 - round(s * 10)) * n + tie_rank[pos])
+    return {g: [tie[k % n] for k in sorted(lst)] for g, lst in keys.items()}
+
+def _match_token(index, qt):
+    """Liefert {Token: Score} für ein Suchwort: exakt 3, Präfix 2, Infix 1.5, Tippfehler <= 1."""
+    vocab, grams = index["vocab"], index["grams"]
+    tok_scores = {}
+    i = bisect.bisect_left(vocab, qt)
+    while i < len(vocab) and vocab[i].startswith(qt):
+        tok_scores[vocab[i]] = 3.0 if vocab[i] == qt else 2.0
+        i += 1
+    if len(qt) >= 3:
+        # Infix (z.B. "milch" in "vollmilch"): alle ungepolsterten Trigramme müssen im Token vorkommen
+        cands = sorted((set(grams.get(g, ())) for g in _trigrams(qt, padded=False)), key=len)
+        inter = set.intersection(*cands) if cands and all(cands) else set()
+        for t_i in inter:
+            if vocab[t_i] not in tok_scores and qt in vocab[t_i]: tok_scores[vocab[t_i]] = 1.5
+    if not tok_scores and len(qt) >= 4:
+        # Tippfehler: Kandidaten über Trigramm-Überlappung, danach difflib wie in is_ingredient_match
+        q_grams = _trigrams(qt)
+        overlap = Counter(t_i for g in q_grams for t_i in grams.get(g, ()))
+        for t_i, cnt in overlap.most_common(200):
+            if cnt < len(q_grams) / 3: break
+            ratio = difflib.SequenceMatcher(None, qt, vocab[t_i]).ratio()
+            if ratio >= 0.75: tok_scores[vocab[t_i]] = ratio
+    return tok_scores
+
+def _token_hits(index, qt):
+    hits = {}
+    for tok, s in _match_token(index, qt).items():
+        for pos, w in index["postings"][tok].items():
+            if s * w > hits.get(pos, 0.0): hits[pos] = s * w
+    return hits
+
+def _short_score(index, pos, qt):
+    """Score eines kurzen Suchworts für einen einzelnen Kandidaten – gleiche Stufen wie _match_token."""
+    return max(((3.0 if tok == qt else 2.0 if tok.startswith(qt) else 1.5 if qt in tok else 0.0) * w for tok, w in index["pos_tokens"][pos]), default=0.0)
+
+def _rank(index, scores, q_norm, limit=None):
+    names = index["names"]
+    for p in scores:
+        if names[p] == q_norm: scores[p] += 5.0
+        elif names[p].startswith(q_norm): scores[p] += 2.0
+    key = lambda p: (-scores[p], len(names[p]), names[p])
+    return sorted(scores, key=key) if limit is None else heapq.nsmallest(limit, scores, key=key)
+
+def search_index(index, query, limit=PICKER_TOP_N):
+    """Gerankte Zeilenpositionen (für df.iloc) zur Suchanfrage; jedes Suchwort muss treffen. Leere Anfrage -> alphabetisch."""
+    q_tokens = normalize_text(query).split()
+    if not q_tokens: return index["order"][:limit]
+    long_q, short_q = [qt for qt in q_tokens if len(qt) >= 3], [qt for qt in q_tokens if len(qt) < 3]
+    # Typischer erster Tastendruck: vorberechnete Liste, nur noch Slicing (Infix wie früher str.contains, z.B. "ei" in "brei")
+    if not long_q and len(short_q) == 1: return index["short_ranked"].get(short_q[0], [])[:limit]
+    scores = None
+    for qt in long_q:
+        hits = _token_hits(index, qt)
+        scores = hits if scores is None else {p: v + hits[p] for p, v in scores.items() if p in hits}
+        if not scores: return []
+    if scores is None:
+        # Nur kurze Suchwörter (z.B. "a e"): kürzeste vorgerankte Liste in Rangfolge ablaufen und früh abbrechen
+        ranked = min((index["short_ranked"].get(qt, []) for qt in short_q), key=len)
+        scores = {}
+        for p in ranked:
+            s = [_short_score(index, p, qt) for qt in short_q]
+            if all(s): scores[p] = sum(s)
+            if len(scores) >= limit: break
+    # Kurze Suchwörter nur noch gegen die verbliebenen Kandidaten prüfen, statt fast alle Postings zu vereinigen
+    for qt in short_q:
+        scores = {p: v + s for p, v in scores.items() if (s := _short_score(index, p, qt))}
+        if not scores: return []
+    return _rank(index, scores, " ".join(q_tokens), limit)
+
+def data_version(df, fields=("Name", "Marke")):
+    """Billiger Fingerabdruck der indexierten Spalten – ändert sich nur, wenn sich Namen/Marken ändern."""
+    cols = [f for f in fields if f in df.columns]
+    if df.empty or not cols: return 0
+    return hash(pd.util.hash_pandas_object(df[cols].astype(str), index=False).values.tobytes())  # reihenfolgesensitiv, da der Index Zeilenpositionen liefert
+
+@st.cache_resource(max_entries=8)
+def _cached_search_index(sheet_name, version, _df):
+    return build_search_index(_df)
+
+def get_search_index(df, sheet_name):
+    """Einmal pro Datenstand gebauter Index, geteilt von Fast-Track, Rezept-Labor und Vorratssuche."""
+    return _cached_search_index(sheet_name, data_version(df), df)
+
 # ==========================================
 # API ENGINE (OFF + USDA)
 # ==========================================
@@ -160,16 +377,19 @@ def get_usda_data_by_id(fdc_id, api_key):
 # ==========================================
 # BESTANDS- & REZEPT-LOGIK
 # ==========================================
+def merge_inventory_entry(old, entry):
+    """Merge-Regel für gleiche Name+Marke: Menge in Gramm addieren (Einheit des Bestands bleibt), Preise summieren, frühestes MHD."""
+    old_g = to_grams(old["Menge"], old["Einheit"], old["Name"])
+    new_g = to_grams(entry["Menge"], entry["Einheit"], entry["Name"])
+    altes_mhd, neues_mhd = str(old["MHD"]), str(entry["MHD"])
+    return {"Menge": from_grams(old_g + new_g, old["Einheit"], old["Name"]), "Preis": safe_float(old["Preis"]) + safe_float(entry["Preis"]),
+            "MHD": min(altes_mhd, neues_mhd) if altes_mhd and neues_mhd else (neues_mhd or altes_mhd)}
+
 def add_to_inventory(inv_df, entry):
     mask = (inv_df["Name"] == entry["Name"]) & (inv_df["Marke"] == entry["Marke"])
     if mask.any():
         idx = inv_df[mask].index[0]
-        old_g = to_grams(inv_df.at[idx, "Menge"], inv_df.at[idx, "Einheit"], inv_df.at[idx, "Name"])
-        new_g = to_grams(entry["Menge"], entry["Einheit"], entry["Name"])
-        inv_df.at[idx, "Menge"] = from_grams(old_g + new_g, inv_df.at[idx, "Einheit"], inv_df.at[idx, "Name"])
-        inv_df.at[idx, "Preis"] = float(inv_df.at[idx, "Preis"]) + float(entry["Preis"])
-        altes_mhd, neues_mhd = str(inv_df.at[idx, "MHD"]), str(entry["MHD"])
-        inv_df.at[idx, "MHD"] = min(altes_mhd, neues_mhd) if altes_mhd and neues_mhd else neues_mhd
+        for k, v in merge_inventory_entry(inv_df.loc[idx], entry).items(): inv_df.at[idx, k] = v
     else: 
         inv_df = pd.concat([inv_df, pd.DataFrame([entry])], ignore_index=True)
     return inv_df
@@ -197,8 +417,11 @@ def calculate_recipe_totals(zutaten_liste):
     nutrients_100g = {n: (val / total_g) * 100.0 if total_g > 0 else 0 for n, val in sum_nutrients.items()}
     return total_g, total_cost, nutrients_100g
 
-def deduct_cooked_recipe_from_inventory(zutaten_liste, inv_df, generate_shopping_list=False):
+def deduct_cooked_recipe_from_inventory(zutaten_liste, inv_df, generate_shopping_list=False, track_intake=True):
+    """track_intake=False, wenn die Zutaten nur verkocht und nicht gegessen werden: Historie-Aktion "Verkocht" ohne Vektor,
+    die Aufnahme bucht dann der Aufrufer (log_consumption für die gegessene Portion)."""
     shopping_list = []
+    intake = {}
     for z in zutaten_liste:
         needed_g = to_grams(z["RezeptMenge"], z["Einheit_Std"], z["Name"])
         for idx, row in inv_df.iterrows():
@@ -214,11 +437,14 @@ def deduct_cooked_recipe_from_inventory(zutaten_liste, inv_df, generate_shopping
                 
                 needed_g -= take_g
                 if take_g > 0 and not generate_shopping_list:
-                    log_history("Verbrauch", row["Name"], row["Marke"], -from_grams(take_g, row["Einheit"], row["Name"]), row["Einheit"], 0)
+                    vec = nutrient_vector(row, take_g) if track_intake else {}
+                    log_history("Verbrauch" if track_intake else "Verkocht", row["Name"], row["Marke"], -from_grams(take_g, row["Einheit"], row["Name"]), row["Einheit"], 0, vec if track_intake else None)
+                    for n, v in vec.items(): intake[n] = intake.get(n, 0.0) + v
         
         if needed_g > 0 and generate_shopping_list:
             shopping_list.append({"Name": z["Name"], "Fehlmenge": from_grams(needed_g, z["Einheit_Std"], z["Name"]), "Einheit": z["Einheit_Std"]})
             
+    if intake: update_daily_intake(datetime.now().strftime("%Y-%m-%d"), intake)  # Ein Sheet-Update pro Vorgang statt pro Zutat
     if not generate_shopping_list:
         inv_df["Menge"] = pd.to_numeric(inv_df["Menge"], errors="coerce").fillna(0)
         inv_df = inv_df[inv_df["Menge"] > 0.01].reset_index(drop=True)
@@ -232,3 +458,192 @@ def get_stats_data(history_df):
     df["Datum"] = pd.to_datetime(df["Datum"])
     df["Preis"] = pd.to_numeric(df["Preis"], errors='coerce').fillna(0)
     return df[df["Preis"] > 0]
+
+def get_intake_data(intake_df):
+    if intake_df.empty: return pd.DataFrame()
+    df = intake_df.copy()
+    df["Datum"] = pd.to_datetime(df["Datum"], errors="coerce")
+    for n in ALL_NUTRIENTS: df[n] = pd.to_numeric(df[n], errors="coerce").fillna(0) if n in df else 0.0
+    return df.dropna(subset=["Datum"]).sort_values("Datum")
+
+# ==========================================
+# BULK IMPORT / EXPORT (CSV, STREAMING)
+# ==========================================
+BULK_CHUNK_ROWS = 5000
+BULK_RETRIES = 6
+SHEETS_CELL_LIMIT = 10_000_000  # Google-Sheets-Obergrenze pro Tabelle (alle Blätter zusammen)
+BULK_KEYS = {DB_FILE: ["Name", "Marke"], LIB_FILE: ["Name", "Marke"], RECIPE_FILE: ["ID"]}
+BULK_UNIT_COLS = {DB_FILE: ("Menge", "Einheit"), LIB_FILE: ("Menge_Std", "Einheit_Std")}
+BULK_NUMERIC = ["Menge", "Menge_Std", "Preis", "Preis_Gesamt", "Gewicht_Gesamt"] + ALL_NUTRIENTS
+UNIT_ALIASES = {"gr": "g", "gramm": "g", "kilo": "kg", "kilogramm": "kg", "l": "L", "liter": "L", "stk": "Stk.", "st.": "Stk.", "stück": "Stk.", "stueck": "Stk."}
+
+def normalize_unit(unit):
+    u = str(unit).strip()
+    if u in UNITS: return u
+    return next((x for x in UNITS if x.lower() == u.lower()), UNIT_ALIASES.get(u.lower()))
+
+def parse_date(val):
+    """ISO zuerst, dann deutsches Format (01.02.2027 = 1. Februar) – nie Tag und Monat vertauschen."""
+    for fmt in ("%Y-%m-%d", "%d.%m.%Y", "%d.%m.%y"):
+        try: return datetime.strptime(val, fmt).strftime("%Y-%m-%d")
+        except ValueError: pass
+    d = pd.to_datetime(val, errors="coerce", dayfirst=True)
+    return None if pd.isna(d) else d.strftime("%Y-%m-%d")
+
+def bulk_defaults(sheet_name):
+    return {c: 0.0 if c in BULK_NUMERIC else "" for c in SCHEMAS[sheet_name]}
+
+def validate_bulk_chunk(chunk, sheet_name, first_line=2):
+    """Prüft einen CSV-Chunk gegen das Schema aus init_dbs. Liefert ([(Zeile, Eintrag)], [(Zeile, Grund)]).
+    Einträge enthalten nur Schema-Spalten, die in der CSV vorkommen – fehlende Spalten überschreiben beim Upsert nichts."""
+    keys, unit_cols = BULK_KEYS[sheet_name], BULK_UNIT_COLS.get(sheet_name, ())
+    missing = [k for k in keys + list(unit_cols) if k not in chunk.columns]
+    if missing: raise ValueError(f"Pflichtspalten fehlen in der CSV: {missing}")
+    cols = [c for c in SCHEMAS[sheet_name] if c in chunk.columns]
+    entries, errors = [], []
+    for line, rec in enumerate(chunk.to_dict("records"), start=first_line):
+        e = {c: str(rec[c]).strip() for c in cols}
+        try:
+            if not e[keys[0]]: raise ValueError(f"{keys[0]} fehlt")
+            for c in e:
+                if c in BULK_NUMERIC:
+                    try: val = float(e[c]) if e[c] else 0.0
+                    except ValueError: raise ValueError(f"{c}='{e[c]}' ist keine Zahl")
+                    if not math.isfinite(val): raise ValueError(f"{c}='{e[c]}' ist keine endliche Zahl")
+                    e[c] = val
+            if unit_cols:
+                m_col, u_col = unit_cols
+                unit = normalize_unit(e[u_col])
+                if unit is None: raise ValueError(f"Unbekannte Einheit '{e[u_col]}'")
+                e[u_col] = unit
+                if to_grams(e[m_col], unit, e["Name"]) <= 0: raise ValueError(f"{m_col} muss > 0 sein")
+            if e.get("MHD"):
+                mhd = parse_date(e["MHD"])
+                if mhd is None: raise ValueError(f"Ungültiges MHD '{e['MHD']}'")
+                e["MHD"] = mhd
+            if "Zutaten_JSON" in e and not isinstance(json.loads(e["Zutaten_JSON"] or "[]"), list):
+                raise ValueError("Zutaten_JSON ist keine Liste")
+        except ValueError as err: # json.JSONDecodeError ist ebenfalls ein ValueError
+            errors.append((line, str(err))); continue
+        entries.append((line, e))
+    return entries, errors
+
+def _with_retry(call, *args, **kwargs):
+    """Sheets-Aufruf mit exponentiellem Backoff bei Quota (429), Serverfehlern (5xx) und Verbindungsabbrüchen."""
+    for attempt in range(BULK_RETRIES + 1):
+        try: return call(*args, **kwargs)
+        except (gspread.exceptions.APIError, requests.exceptions.ConnectionError) as e:
+            code = getattr(e, "code", None) or getattr(getattr(e, "response", None), "status_code", None)
+            if attempt == BULK_RETRIES or (isinstance(e, gspread.exceptions.APIError) and code not in (408, 429, 500, 502, 503, 504)): raise
+            wait = min(2 ** attempt, 64)
+            print(f"Sheets-API {code or 'Verbindung'}: neuer Versuch in {wait}s ({attempt + 1}/{BULK_RETRIES})")
+            time.sleep(wait)
+
+def _fetch_rows(ws, rows, header, last_col, batch=200):
+    """Lädt nur die betroffenen Tabellenzeilen (für Dedupe/Merge), statt das ganze Sheet.
+    Zusammenhängende Zeilen werden zu einem Bereich gebündelt – ein Re-Import braucht so meist nur einen Lesezugriff pro Chunk."""
+    spans = []
+    for r in rows:
+        if spans and r == spans[-1][1] + 1: spans[-1][1] = r
+        else: spans.append([r, r])
+    out = {}
+    for i in range(0, len(spans), batch):
+        part = spans[i:i+batch]
+        for (a, e), vr in zip(part, _with_retry(ws.batch_get, [f"A{a}:{last_col}{e}" for a, e in part], value_render_option="UNFORMATTED_VALUE")):
+            vr = list(vr)
+            for r in range(a, e + 1):
+                vals = list(vr[r - a]) if r - a < len(vr) else []
+                out[r] = dict(zip(header, vals + [""] * (len(header) - len(vals))))
+    return out
+
+def _read_bulk_csv(path, chunk_rows, start_line, **kwargs):
+    # utf-8-sig entfernt die BOM aus Excel-Exporten, sonst hieße die erste Spalte "\ufeffName"
+    return pd.read_csv(path, chunksize=chunk_rows, dtype=str, keep_default_na=False, encoding="utf-8-sig", skiprows=range(1, start_line - 1), **kwargs)
+
+def bulk_import_csv(path, sheet_name, chunk_rows=BULK_CHUNK_ROWS, start_line=2, log=print):
+    """Streamt eine CSV chunkweise ins Sheet: validieren, Einheiten normalisieren, gegen Bestand deduplizieren, gebündelt schreiben.
+    Vorrat wird wie in add_to_inventory zusammengeführt, Bibliothek/Rezepte per Upsert (Werte aus der CSV gewinnen).
+    CSV-Spalten, die das Schema nicht kennt (z.B. Fiber_100 oder Portionen aus den mitgelieferten Dateien), werden ignoriert und gemeldet.
+    Jeder Chunk wird in einem einzigen batch_update geschrieben; bricht der Import ab, kann er mit start_line fortgesetzt werden."""
+    sheet = get_sheet()
+    init_tab(sheet, sheet_name, SCHEMAS[sheet_name])
+    ws = sheet.worksheet(sheet_name)
+    header, keys = _with_retry(ws.row_values, 1), BULK_KEYS[sheet_name]
+    last_col = rowcol_to_a1(1, len(header))[:-1]
+
+    columns = pd.read_csv(path, nrows=0, dtype=str, encoding="utf-8-sig").columns
+    validate_bulk_chunk(pd.DataFrame(columns=columns), sheet_name)  # Pflichtspalten prüfen, bevor irgendetwas geschrieben wird
+    ignored = [c for c in columns if c not in SCHEMAS[sheet_name]]
+    if ignored: log(f"Ignorierte CSV-Spalten (nicht im Schema von {sheet_name}): {', '.join(ignored)}")
+
+    # Nur die Schlüsselspalten des Bestands im Speicher halten: (Name, Marke) -> Zeilennummer
+    key_cols = [_with_retry(ws.col_values, header.index(k) + 1)[1:] for k in keys]
+    row_of = {tuple(str(v).strip() for v in k): r for r, k in enumerate(zip_longest(*key_cols, fillvalue=""), start=2) if any(k)}
+    next_row = max(len(c) for c in key_cols) + 2
+
+    # Vorab-Check gegen das Zellenlimit der Tabelle (alle Blätter zusammen), nur über die Schlüsselspalten der CSV
+    new_keys = set()
+    for kc in _read_bulk_csv(path, chunk_rows, start_line, usecols=keys):
+        new_keys.update(k for k in (tuple(str(v).strip() for v in t) for t in kc[keys].itertuples(index=False, name=None)) if k not in row_of and k[0])
+    other_cells = sum(w.row_count * w.col_count for w in _with_retry(sheet.worksheets) if w.id != ws.id)
+    needed = other_cells + max(ws.row_count, next_row - 1 + len(new_keys)) * ws.col_count
+    if needed > SHEETS_CELL_LIMIT:
+        raise ValueError(f"Import passt nicht in Google Sheets: {needed:,} Zellen nötig ({len(new_keys):,} neue Zeilen x {ws.col_count} Spalten "
+                         f"+ übrige Blätter), erlaubt sind {SHEETS_CELL_LIMIT:,}. CSV aufteilen oder Bestand ausdünnen.")
+    del new_keys
+
+    stats = {"neu": 0, "aktualisiert": 0, "fehlerhaft": 0}
+    defaults = bulk_defaults(sheet_name)
+    committed_line = start_line - 1
+    try:
+        for c_i, chunk in enumerate(_read_bulk_csv(path, chunk_rows, start_line)):
+            first_line = start_line + c_i * chunk_rows
+            entries, errors = validate_bulk_chunk(chunk, sheet_name, first_line=first_line)
+            for line, reason in errors[:10]: log(f"Zeile {line} übersprungen: {reason}")
+
+            hits = sorted({row_of[k] for k in (tuple(e[c] for c in keys) for _, e in entries) if k in row_of})
+            existing = _fetch_rows(ws, hits, header, last_col)
+            updates, appends = {}, {}
+            for _, e in entries:
+                k = tuple(e[c] for c in keys)
+                target = updates if k in row_of else appends
+                slot = row_of.get(k, k)
+                old = target.get(slot) or existing.get(slot)
+                if old is None: target[slot] = {**defaults, **e}
+                elif sheet_name == DB_FILE: target[slot] = {**old, **merge_inventory_entry(old, {**defaults, **e})}
+                else: target[slot] = {**old, **e}
+
+            # Updates und neue Zeilen in EINEM Request: ein Chunk ist entweder ganz oder gar nicht geschrieben
+            data = [{"range": f"A{r}:{last_col}{r}", "values": [[row.get(c, "") for c in header]]} for r, row in updates.items()]
+            if appends:
+                if next_row + len(appends) - 1 > ws.row_count: _with_retry(ws.add_rows, next_row + len(appends) - 1 - ws.row_count)
+                data.append({"range": f"A{next_row}", "values": [[row.get(c, "") for c in header] for row in appends.values()]})
+            if data: _with_retry(ws.batch_update, data)
+            for k in appends: row_of[k] = next_row; next_row += 1
+
+            committed_line = first_line + len(chunk) - 1
+            stats["neu"] += len(appends); stats["aktualisiert"] += len(updates); stats["fehlerhaft"] += len(errors)
+            log(f"Chunk {c_i + 1}: {len(appends)} neu, {len(updates)} aktualisiert, {len(errors)} fehlerhaft (bis CSV-Zeile {committed_line})")
+    except (gspread.exceptions.APIError, requests.exceptions.ConnectionError):
+        log(f"Abbruch: bis einschließlich CSV-Zeile {committed_line} ist alles geschrieben. Fortsetzen mit --ab-zeile {committed_line + 1}")
+        raise
+    finally:
+        st.cache_data.clear()
+    return stats
+
+def bulk_export_csv(sheet_name, path, chunk_rows=BULK_CHUNK_ROWS):
+    """Schreibt ein Sheet blockweise in eine CSV, ohne alles auf einmal zu laden. Spalten = Sheet-Header (SCHEMAS), nicht das Layout
+    der mitgelieferten CSVs – deren Zusatzspalten (Fiber_100, Portionen, ...) gibt es im Sheet nicht."""
+    ws = get_sheet().worksheet(sheet_name)
+    header = _with_retry(ws.row_values, 1)
+    last_col = rowcol_to_a1(1, len(header))[:-1]
+    written = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for start in range(2, ws.row_count + 1, chunk_rows):
+            rows = _with_retry(ws.get, f"A{start}:{last_col}{min(start + chunk_rows - 1, ws.row_count)}", value_render_option="UNFORMATTED_VALUE")
+            if not rows: break
+            for r in rows:
+                if any(v != "" for v in r): writer.writerow(list(r) + [""] * (len(header) - len(r))); written += 1
+    return written
@@ -0,0 +1,39 @@
+import argparse
+import sys
+
+import gspread
+import requests
+
+from backend import DB_FILE, LIB_FILE, RECIPE_FILE, BULK_CHUNK_ROWS, bulk_import_csv, bulk_export_csv
+
+# ==========================================
+# BULK CSV IMPORT / EXPORT (KOMMANDOZEILE)
+# ==========================================
+# Beispiele:
+#   python bulk_csv.py import Bibliothek bibliothek.csv
+#   python bulk_csv.py export Vorrat vorrat_backup.csv --chunk 2000
+#   python bulk_csv.py import Bibliothek bibliothek.csv --ab-zeile 120002   (nach Abbruch fortsetzen)
+# Zugangsdaten kommen wie in der App aus .streamlit/secrets.toml (google_credentials).
+
+def main():
+    parser = argparse.ArgumentParser(description="NutriStock Pro: große CSV-Dateien chunkweise in Google Sheets importieren oder daraus exportieren.")
+    parser.add_argument("befehl", choices=["import", "export"])
+    parser.add_argument("tabelle", choices=[DB_FILE, LIB_FILE, RECIPE_FILE])
+    parser.add_argument("datei", help="Pfad zur CSV-Datei")
+    parser.add_argument("--chunk", type=int, default=BULK_CHUNK_ROWS, help=f"Zeilen pro Chunk (Standard: {BULK_CHUNK_ROWS})")
+    parser.add_argument("--ab-zeile", type=int, default=2, help="Import ab dieser CSV-Zeile fortsetzen (Zeile 1 = Kopfzeile)")
+    args = parser.parse_args()
+
+    try:
+        if args.befehl == "import":
+            stats = bulk_import_csv(args.datei, args.tabelle, chunk_rows=args.chunk, start_line=max(args.ab_zeile, 2))
+            print(f"Import fertig: {stats['neu']} neu, {stats['aktualisiert']} aktualisiert, {stats['fehlerhaft']} fehlerhaft.")
+        else:
+            print(f"Export fertig: {bulk_export_csv(args.tabelle, args.datei, chunk_rows=args.chunk)} Zeilen nach {args.datei} geschrieben.")
+    except (ValueError, OSError) as e: # Fehlende Pflichtspalten, kaputte CSV, Datei nicht gefunden, Zellenlimit
+        sys.exit(f"Fehler: {e}")
+    except (gspread.exceptions.APIError, requests.exceptions.ConnectionError) as e: # Quota/Serverfehler auch nach allen Wiederholungen
+        sys.exit(f"Google-Sheets-Fehler: {e}")
+
+if __name__ == "__main__":
+    main()